@@ -68,12 +68,15 @@ st.markdown("""
             padding-bottom: 5rem;
         }
         
-        /* Chat Bubble Styles */
+        /* Chat Bubble Styles - one container per message so new messages are appended, not re-rendered */
         .chat-container {
             display: flex;
             flex-direction: column;
-            gap: 10px;
-            margin-bottom: 80px; /* Space for fixed input */
+            margin-bottom: 10px;
+        }
+        
+        .chat-spacer {
+            height: 80px; /* Space for fixed input */
         }
         
         .user-bubble {
@@ -144,37 +147,50 @@ except Exception as e:
     st.stop()
 
 # --- SESSION STATE ---
+CHAT_WINDOW = 20  # Messages shown at once; older ones are loaded on demand
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
-
-# --- DISPLAY CHAT HISTORY (Custom HTML) ---
-chat_html = '<div class="chat-container">'
-for message in st.session_state.messages:
-    if message["role"] == "user":
-        chat_html += f'<div class="user-bubble">{message["content"]}</div>'
-    else:
-        chat_html += f'<div class="bot-bubble">{message["content"]}</div>'
-chat_html += '</div>'
-st.markdown(chat_html, unsafe_allow_html=True)
+if "visible_count" not in st.session_state:
+    st.session_state.visible_count = CHAT_WINDOW
+
+def render_message(message):
+    """Renders a single chat bubble as its own element."""
+    bubble_class = "user-bubble" if message["role"] == "user" else "bot-bubble"
+    st.markdown(f'<div class="chat-container"><div class="{bubble_class}">{message["content"]}</div></div>', unsafe_allow_html=True)
+
+# --- DISPLAY CHAT HISTORY (Windowed) ---
+hidden_count = max(len(st.session_state.messages) - st.session_state.visible_count, 0)
+if hidden_count:
+    if st.button(f"Load earlier messages ({hidden_count} hidden)"):
+        st.session_state.visible_count += CHAT_WINDOW
+        st.rerun()
+
+chat_box = st.container()
+with chat_box:
+    for message in st.session_state.messages[hidden_count:]:
+        render_message(message)
 
 # --- CHAT INPUT ---
+# Submit -> generate -> display all happen in this script run: new messages are appended to the chat box
 if prompt := st.chat_input("Type a message..."):
-    # 1. Add User Message to State
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    
-    # 2. Force Rerun 
-    st.rerun()
-
-# --- GENERATE RESPONSE (After Rerun) ---
-# Check if the last message is from user, if so, generate response
-if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-    with st.spinner("..."):
-        try:
-            response = brain.generate_response(st.session_state.messages[-1]["content"])
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            st.rerun()
-        except Exception as e:
-            st.error(f"Error: {e}")
+    user_message = {"role": "user", "content": prompt}
+    st.session_state.messages.append(user_message)
+    with chat_box:
+        render_message(user_message)
+        with st.spinner("..."):
+            try:
+                response = brain.generate_response(prompt)
+                bot_message = {"role": "assistant", "content": response}
+                st.session_state.messages.append(bot_message)
+                render_message(bot_message)
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    # Sending a message collapses any loaded-on-demand history back to the latest window
+    st.session_state.visible_count = CHAT_WINDOW
+
+st.markdown('<div class="chat-spacer"></div>', unsafe_allow_html=True)
 
 # --- SIDEBAR FEEDBACK UI ---
 with st.sidebar:
@@ -1,10 +1,16 @@
 import os
 import json
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import google.generativeai as genai
 from pinecone import Pinecone
 from sentence_transformers import SentenceTransformer, util
 from dotenv import load_dotenv
+from resilience import GuardedCall
+from ingest import get_namespace, PARTITION_DIR
+from prompts import ROUTER_TEMPLATE, GENERATOR_TEMPLATE, LocalPrefixCache, GeminiContextCache, format_history
 
 # --- CONFIGURATION ---
 load_dotenv()
@@ -13,26 +19,27 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "college-rag")
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 GENERATION_MODEL = "gemini-2.0-flash"
+# Static prompt prefix reuse: "local" (system_instruction per model) or "gemini" (provider-side context cache)
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "local")
+# Multi-query retrieval: how many query variants (current turn + history rewrites) to search with
+MAX_QUERY_VARIANTS = 3
+SEARCH_WORKERS = 8
+TOP_K = 5
+SCORE_THRESHOLD = 0.3
+# If the routed partition's best match scores below this, fan out to the other partitions
+WEAK_RESULT_SCORE = 0.45
+# Vector store tail-latency protection
+SEARCH_TIMEOUT_S = float(os.getenv("SEARCH_TIMEOUT_S", "2.0"))   # Per-call deadline
+HEDGE_PERCENTILE = 95       # Send a hedged second request once a call is slower than this percentile
+BREAKER_FAILURES = 5        # Consecutive timeouts/errors before routing to the local snapshot
+BREAKER_RESET_S = 30        # How long the breaker stays open before trying Pinecone again
+# Words/openers that signal a follow-up that only makes sense with the previous turn
+# (personal pronouns only: "it"/"this"/"there" also open plenty of fresh questions, e.g. "Is there a gym?")
+FOLLOW_UP_PRONOUNS = {"he", "him", "his", "she", "her", "hers", "they", "them", "their"}
+FOLLOW_UP_OPENERS = ("what about", "how about", "and ", "also ", "what else", "same for")
+FOLLOW_UP_MAX_WORDS = 6  # Longer queries are treated as self-contained
 LOCAL_FACULTY_DATA = r"c:\Users\rohan\OneDrive\Desktop\Work\PROJECTS\COLLEGE RAG PROJECT PRIMARY\eee_faculty_data.json"
 
-SYSTEM_PROMPT = """
-You are 'Digital Senior', a helpful senior student at NIT Warangal.
-
-Rules:
-1. **CRITICAL:** Answer directly and confidently. Treat the provided Context as your own absolute internal knowledge.
-2. **NEVER** reference "the context", "the provided text", "the documents", or "the information provided". Phrases like "Based on the context" or "The text doesn't say" are STRICTLY FORBIDDEN.
-3. If the answer is not in your knowledge base (the Context), simply say "I don't have enough information to answer that" or "I'm not sure about that specifically". Do NOT excuse yourself by blaming the missing context.
-4. Be concise, professional, and friendly.
-5. Do NOT start with greetings like "Hey there". Start directly with the answer.
-6. Do NOT end with "Hope this helps".
-7. OUTPUT FORMAT: PLAIN TEXT ONLY. No Markdown (no **, *, #). Use simple numbering (1., 2.) or dashes (-) for lists.
-8. **restaurant Reviews:** When answering about restaurants:
-    - IGNORE the names of the people writing the reviews (e.g. "syed zafar", "Anil Kumar"). They are irrelevant.
-    - Focus ONLY on the **Restaurant Name** and the **Substance** of the review (good food, bad service, specific dishes).
-    - If the context contains a list of reviews, summarize the general sentiment or specific dishes mentioned for that restaurant.
-    - Expected Format: "- [Restaurant Name]: [Summary of what's good/bad] (Price/Location if available)"
-"""
-
 class DigitalSeniorBrain:
     def __init__(self):
         print("Initializing Brain...")
@@ -41,16 +48,24 @@ class DigitalSeniorBrain:
         if not GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY not found in .env")
         genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(
-            model_name=GENERATION_MODEL,
-            system_instruction=SYSTEM_PROMPT
-        )
+        # Static prompt prefixes (router rules, system prompt) are attached once per model
+        if PROMPT_CACHE == "gemini":
+            self.prompt_cache = GeminiContextCache(GENERATION_MODEL)
+        else:
+            self.prompt_cache = LocalPrefixCache(GENERATION_MODEL)
         
         # 2. Setup Pinecone
         if not PINECONE_API_KEY:
             raise ValueError("PINECONE_API_KEY not found in .env")
         self.pc = Pinecone(api_key=PINECONE_API_KEY)
         self.index = self.pc.Index(INDEX_NAME)
+        self.vector_guard = GuardedCall(
+            "Pinecone",
+            timeout=SEARCH_TIMEOUT_S,
+            hedge_percentile=HEDGE_PERCENTILE,
+            failure_threshold=BREAKER_FAILURES,
+            reset_timeout=BREAKER_RESET_S
+        )
         
         # 3. Setup Embedder
         print(f"Loading Embedder ({EMBEDDING_MODEL})...")
@@ -59,6 +74,16 @@ class DigitalSeniorBrain:
         # 4. Memory (Simple list for now)
         self.history = []
 
+        # Worker pool for running vector queries (variants x partitions) concurrently
+        self.search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+
+        # Per-category partitions: one Pinecone namespace per category. The local
+        # manifest/snapshots only decide exhaustive vs. index search (and failover).
+        self.partitions = {}
+        self.local_partitions = {}
+        self._load_partitions()
+        self.namespaces = self._list_namespaces()
+
         # 5. Load Local Faculty Data
         self.local_data = []
         self.local_embeddings = None
@@ -74,125 +99,224 @@ class DigitalSeniorBrain:
         else:
             print("Warning: Local faculty data file not found.")
         
-    def _get_embedding(self, text):
-        return self.embedder.encode(text).tolist()
+    def _load_partitions(self):
+        """
+        Loads the partition manifest and the local partition snapshots written by ingest.py.
+        Small partitions are searched in memory; the rest are the failover copy of Pinecone.
+        """
+        manifest_path = os.path.join(PARTITION_DIR, "manifest.json")
+        if not os.path.exists(manifest_path):
+            print("Warning: Partition manifest not found. All partitions will be searched in Pinecone.")
+            return
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.partitions = json.load(f)
+
+        for namespace in self.partitions:
+            partition_path = os.path.join(PARTITION_DIR, f"{namespace}.json")
+            if os.path.exists(partition_path):
+                with open(partition_path, 'r', encoding='utf-8') as f:
+                    vectors = json.load(f)
+                self.local_partitions[namespace] = {
+                    "ids": [v["id"] for v in vectors],
+                    "metadata": [v["metadata"] for v in vectors],
+                    "embeddings": np.array([v["values"] for v in vectors], dtype=np.float32)
+                }
+        print(f"Loaded {len(self.partitions)} partitions ({len(self.local_partitions)} local snapshots).")
+
+    def _list_namespaces(self):
+        """All partitions for cross-partition fan-out, straight from Pinecone (manifest as fallback)."""
+        try:
+            namespaces = list(self.index.describe_index_stats().namespaces)
+        except Exception as e:
+            print(f"Pinecone Stats Error: {e}. Using local manifest for fan-out.")
+            namespaces = list(self.partitions)
+        print(f"Found {len(namespaces)} namespaces: {namespaces}")
+        return namespaces
+
+    def _search_local(self, namespace, vector, meta_filter):
+        """Exhaustive scan of a local partition snapshot. Returns the same shape as _query_partition."""
+        local = self.local_partitions.get(namespace)
+        if local is None:
+            return []
+
+        hits = util.semantic_search(vector, local["embeddings"], top_k=len(local["metadata"]))[0]
+        matches = []
+        for hit in hits:
+            metadata = local["metadata"][hit['corpus_id']]
+            # Same semantics as Pinecone: a list-valued filter (merged duplicates) matches any element
+            stored_filter = metadata.get("filter")
+            stored_filters = stored_filter if isinstance(stored_filter, list) else [stored_filter]
+            if meta_filter.get("filter") and meta_filter["filter"] not in stored_filters:
+                continue
+            matches.append({"id": local["ids"][hit['corpus_id']], "score": hit['score'], "metadata": metadata})
+            if len(matches) == TOP_K:
+                break
+        return matches
+
+    def _query_partition(self, namespace, vector, meta_filter):
+        """
+        Runs one query vector against one partition.
+        Returns: list of { "id", "score", "metadata" } dicts.
+        """
+        if self.partitions.get(namespace, {}).get("mode") == "exhaustive" and namespace in self.local_partitions:
+            return self._search_local(namespace, vector, meta_filter)
+
+        def remote_query():
+            results = self.index.query(
+                vector=vector.tolist(),
+                top_k=TOP_K,
+                include_metadata=True,
+                filter=meta_filter if meta_filter else None,
+                namespace=namespace
+            )
+            return [{"id": m.id, "score": m.score, "metadata": m.metadata} for m in results.matches]
+
+        # Deadline + hedging + circuit breaker; degraded Pinecone falls back to the local snapshot
+        return self.vector_guard.call(remote_query, lambda: self._search_local(namespace, vector, meta_filter))
+
+    def search_stats(self):
+        """Vector store health counters (timeouts, hedges, failovers, breaker state)."""
+        return self.vector_guard.stats()
+
+    def _search_partitions(self, namespaces, vectors, meta_filter):
+        """Queries every (partition, variant) pair concurrently. Returns the best match per vector ID."""
+        jobs = [(namespace, vector) for namespace in namespaces for vector in vectors]
+        best_matches = {}
+        for matches in self.search_pool.map(lambda job: self._query_partition(job[0], job[1], meta_filter), jobs):
+            for match in matches:
+                if match["score"] > SCORE_THRESHOLD and (match["id"] not in best_matches or match["score"] > best_matches[match["id"]]["score"]):
+                    best_matches[match["id"]] = match
+        return best_matches
 
     def classify_intent(self, query):
         """
         Decides if the query needs RAG or is just chit-chat.
         Returns: { "type": "rag_search" | "chit_chat", "category": "..." }
         """
-        history_context = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.history[-3:]])
-        
-        # Define the hierarchy of knowledge available in the system
-        # This helps the LLM understand what specific topics fall under which category
-        knowledge_hierarchy = {
-            "Faculty": ["Specific Professors (e.g., D V S S Siva Sarma)", "Research Areas", "Teaching Style"],
-            "Academics": ["Attendance Policy", "UG Regulations", "Academic Calendar", "Student Feedback"],
-            "Food": ["Canteens", "Messes (e.g. IFC - B)", "Menu"],
-            "Hostels": ["Hostel Blocks (e.g., Azad, Bose)", "General Rules", "Facilities", "Wardens", "Repairs (LAN, Electrician, Plumbing)", "Issues"],
-            "Placements": ["Company Details", "Placement Statistics"],
-            "Campus_Life": ["Fests", "Clubs", "Events"],
-            "Admin": ["Fees & Scholarships", "Documents & Transcripts"],
-            "Facilities": ["Library", "Health Centre", "Sports"],
-            "Guides": ["City Guide", "Freshers Guide"],
-            "Internships": ["Company Specific Experiences (e.g. Amazon, Microsoft)", "Process", "Questions"]
-        }
-        
-        hierarchy_str = json.dumps(knowledge_hierarchy, indent=2)
-        
-        prompt = f"""
-        You are the Router for a college chatbot. Your job is to classify the user's intent into one of the available categories or identify it as chit-chat.
-        
-        User Query: "{query}"
-        Recent History:
-        {history_context}
-        
-        Available Knowledge Hierarchy (Category -> Subcategories/Topics):
-        {hierarchy_str}
-        
-        Instructions:
-        1. Analyze the User Query to understand what they are looking for.
-        2. Match their intent to the most relevant 'Category' from the hierarchy above. Use the subcategories as strong hints.
-           - Example: "When is the exam?" -> Matches 'Academic Calendar' -> Category: "Academics"
-           - Example: "Who is the warden of Azad Hall?" -> Matches 'Wardens'/'Hostel Blocks' -> Category: "Hostels"
-           - Example: "Tell me about Prof Siva Sarma" -> Matches 'Specific Professors' -> Category: "Faculty"
-           - Example: "What is for dinner in IFC B?" -> Matches 'Messes' -> Category: "Food", filters: {{ "filter": "IFC - B" }}
-           - Example: "Lan repair number?" -> Matches 'Repairs' -> Category: "Hostels"
-        3. If the user asks about a specific topic not explicitly listed but related to a category (e.g., "Mess menu" relates to "Food"), choose that category.
-        4. Extract 'filter' for:
-           - 'Internships' (Target: Company Name)
-           - 'Food' (Target: Mess Name)
-           - 'Academics' (Target: Specific Course Name).
-             - Do NOT extract generic terms like "Credits", "Syllabus", "Exams", "Regulations", "Grades" as filters. Set "filter": null for general queries.
-             - Example: "Syllabus for Digital Electronics" -> Category: "Academics", filters: {{ "filter": "Digital Electronics" }}
-             - Example: "How are credits assigned?" -> Category: "Academics", filters: {{ "filter": null }}
-        5. If the user says "Hi", "Thanks", "Bye", or asks a general question NOT about the college (e.g. "What is 2+2?"), output type="chit_chat".
-        
-        Output JSON ONLY:
-        {{ "type": "rag_search" | "chit_chat", "category": "CategoryName" | null, "filters": {{ "filter": "FILTER_VALUE" | null }} }}
-        """
+        history_context = format_history(self.history, 3)
+        prompt = ROUTER_TEMPLATE.render(query=query, history=history_context)
+        print(f"Router prompt tokens: {ROUTER_TEMPLATE.section_tokens(query=query, history=history_context)}")
         
         try:
-            response = self.model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+            router_model = self.prompt_cache.get_model(ROUTER_TEMPLATE)
+            response = router_model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
             return json.loads(response.text)
         except Exception as e:
             print(f"Router Error: {e}")
             return {"type": "chit_chat", "category": None}
 
-    def search_db(self, query, category, filters=None):
+    def build_query_variants(self, query, intent=None):
         """
-        Searches Pinecone for context within a specific category and optional filters.
+        Derives a small set of search queries for the current turn.
+        Uses the router's standalone rewrite (if any) plus a rule-based
+        condensation of the previous user turn for follow-up questions.
+        Returns: list of unique query strings, original query first.
         """
-        # Generate embedding
-        vector = self._get_embedding(query)
-        
-        # Construct metadata filter
-        meta_filter = {}
-        if category:
-            meta_filter["category"] = category
+        variants = [query]
+
+        # 1. Router rewrite (piggybacks on the classify_intent call, no extra round-trip)
+        rewrite = (intent or {}).get("search_query") or ""
+        rewrite = rewrite.strip()
+        if rewrite:
+            variants.append(rewrite)
+
+        # 2. Rule-based condensation: short follow-ups like "what about his exam pattern?"
+        # If the router already rewrote the query, only an explicit opener still triggers it.
+        previous_queries = [msg["content"] for msg in self.history if msg["role"] == "user"]
+        if previous_queries:
+            lowered = query.lower().strip()
+            words = re.findall(r"[a-z']+", lowered)
+            if len(words) <= FOLLOW_UP_MAX_WORDS:
+                starts_with_opener = lowered.startswith(FOLLOW_UP_OPENERS)
+                has_pronoun = bool(set(words) & FOLLOW_UP_PRONOUNS)
+                router_rewrote = bool(rewrite) and rewrite.lower() != lowered
+                if starts_with_opener or (has_pronoun and not router_rewrote):
+                    variants.append(f"{previous_queries[-1]} {query}")
+
+        # Deduplicate (case-insensitive) while keeping order
+        unique_variants = []
+        seen = set()
+        for variant in variants:
+            key = variant.lower()
+            if variant and key not in seen:
+                seen.add(key)
+                unique_variants.append(variant)
 
+        return unique_variants[:MAX_QUERY_VARIANTS]
+
+    def search_db(self, query, category, filters=None, query_variants=None):
+        """
+        Searches the routed category's partition for context, with optional filters.
+        Falls back to a cross-partition fan-out when the category is None or results are weak.
+        If query_variants is given, all variants are embedded in one batch and
+        queried concurrently; matches are merged and deduplicated.
+        """
+        variants = query_variants or [query]
+
+        # Generate embeddings (one batched call for all variants)
+        vectors = self.embedder.encode(variants)
+        
         # SAFETY CHECK: Only allow filters for Internships and Food
         # This overrides any LLM hallucination for categories like Academics
         valid_filter_categories = ["Internships", "Food", "Academics"]
         if category not in valid_filter_categories and filters:
              filters["filter"] = None
 
+        # Construct metadata filter. The category is the namespace itself.
+        meta_filter = {}
         if filters and filters.get("filter"):
             meta_filter["filter"] = filters["filter"].upper()  # Ensure matches ingestion format
 
-        print(f"Searching DB for '{query}' in category '{category}' with filters {meta_filter}...")
+        if category:
+            namespaces = [get_namespace(category)]
+        else:
+            namespaces = list(self.namespaces)  # No category: fan out across all partitions
+
+        print(f"Searching DB for {variants} in partitions {namespaces} with filters {meta_filter}...")
 
         contexts = []
 
-        # 1. Search Pinecone (Remote DB)
+        # 1. Search Pinecone / in-memory partitions - one query per (partition, variant), run concurrently
         try:
-            results = self.index.query(
-                vector=vector,
-                top_k=5,
-                include_metadata=True,
-                filter=meta_filter if meta_filter else None
-            )
-            
-            for match in results.matches:
-                if match.score > 0.3:
-                    text_to_use = match.metadata.get("context_text", match.metadata.get("text", ""))
+            best_matches = self._search_partitions(namespaces, vectors, meta_filter)
+
+            # Weak or empty results from the routed partition: fan out to the rest (without the category-specific filter)
+            top_score = max((m["score"] for m in best_matches.values()), default=0)
+            if category and top_score < WEAK_RESULT_SCORE:
+                other_namespaces = [ns for ns in self.namespaces if ns not in namespaces]
+                print(f"Weak results in '{category}' (best {top_score:.2f}). Fanning out to {other_namespaces}...")
+                for match_id, match in self._search_partitions(other_namespaces, vectors, {}).items():
+                    if match_id not in best_matches:
+                        best_matches[match_id] = match
+
+            ranked = sorted(best_matches.values(), key=lambda m: m["score"], reverse=True)[:TOP_K]
+            for match in ranked:
+                text_to_use = match["metadata"].get("context_text", match["metadata"].get("text", ""))
+                # Parent-child chunks share the same parent text; only add it once
+                if text_to_use not in contexts:
                     contexts.append(text_to_use)
         except Exception as e:
             print(f"Pinecone Search Error: {e}")
+        print(f"Vector store stats: {self.search_stats()}")
 
         # 2. Search Local Data (In-Memory)
         # Only if category is Faculty or generic/None (to be safe)
         if self.local_embeddings is not None and (category == "Faculty" or category is None):
             print("Searching local faculty data...")
-            query_embedding = self.embedder.encode(query, convert_to_tensor=True)
-            hits = util.semantic_search(query_embedding, self.local_embeddings, top_k=3)
+            # Reuse the batched embeddings: one hit list per variant
+            hits = util.semantic_search(vectors, self.local_embeddings, top_k=3)
             
-            # Hits is a list of lists (one per query). We only have one query.
-            for hit in hits[0]:
-                if hit['score'] > 0.3: # Threshold
-                    idx = hit['corpus_id']
-                    content = self.local_data[idx]['content']
+            best_local = {}
+            for variant_hits in hits:
+                for hit in variant_hits:
+                    if hit['score'] > 0.3: # Threshold
+                        idx = hit['corpus_id']
+                        best_local[idx] = max(hit['score'], best_local.get(idx, 0))
+
+            for idx in sorted(best_local, key=best_local.get, reverse=True)[:3]:
+                content = self.local_data[idx]['content']
+                if content not in contexts:
                     contexts.append(content)
                 
         return "\n\n".join(contexts)
@@ -206,9 +330,11 @@ class DigitalSeniorBrain:
         print(f"Intent: {intent}")
         
         context = ""
-        if intent["type"] == "rag_search" and intent["category"]:
+        if intent["type"] == "rag_search":
+            # A null category is fine: search_db fans out across all partitions
             filters = intent.get("filters")
-            context = self.search_db(query, intent["category"], filters)
+            query_variants = self.build_query_variants(query, intent)
+            context = self.search_db(query, intent.get("category"), filters, query_variants)
             # Safe print for Windows terminals (Direct Byte Write)
             try:
                 header = "\n--- RETRIEVED CONTEXT START ---\n"
@@ -220,39 +346,15 @@ class DigitalSeniorBrain:
                  print(f"\n--- RETRIEVED CONTEXT START ---\n(Context print failed)\n--- RETRIEVED CONTEXT END ---\n")
             
         # 2. Generate Answer
-        history_context = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.history[-5:]])
-        
-        system_prompt = """
-        You are 'Digital Senior', a helpful senior student at NIT Warangal.
-        
-        Rules:
-        1. **CRITICAL:** Answer directly and confidently. Treat the provided Context as your own absolute internal knowledge.
-        2. **NEVER** reference "the context", "the provided text", "the documents", or "the information provided". Phrases like "Based on the context" or "The text doesn't say" are STRICTLY FORBIDDEN.
-        3. If the answer is not in your knowledge base (the Context), simply say "I don't have enough information to answer that" or "I'm not sure about that specifically". Do NOT excuse yourself by blaming the missing context.
-        4. Be concise, professional, and friendly.
-        5. Do NOT start with greetings like "Hey there". Start directly with the answer.
-        6. Do NOT end with "Hope this helps".
-        7. OUTPUT FORMAT: PLAIN TEXT ONLY. No Markdown (no **, *, #). Use simple numbering (1., 2.) or dashes (-) for lists.
-        8. **Restaurant Reviews:** When answering about restaurants:
-            - IGNORE the names of the people writing the reviews (e.g. "syed zafar", "Anil Kumar"). They are irrelevant.
-            - Focus ONLY on the **Restaurant Name** and the **Substance** of the review (good food, bad service, specific dishes).
-            - If the context contains a list of reviews, summarize the general sentiment or specific dishes mentioned for that restaurant.
-            - Expected Format: "- [Restaurant Name]: [Summary of what's good/bad] (Price/Location if available)"
-        """
-        
-        user_prompt = f"""
-        Context:
-        {context}
-        
-        Chat History:
-        {history_context}
-        
-        User: {query}
-        """
+        history_context = format_history(self.history, 5)
+        user_prompt = GENERATOR_TEMPLATE.render(context=context, history=history_context, query=query)
+        print(f"Generator prompt tokens: {GENERATOR_TEMPLATE.section_tokens(context=context, history=history_context, query=query)}")
         
-        response = self.model.generate_content(
+        # The system prompt is the model's system_instruction / cached prefix; only send the dynamic part
+        generator_model = self.prompt_cache.get_model(GENERATOR_TEMPLATE)
+        response = generator_model.generate_content(
             contents=[
-                {"role": "user", "parts": [system_prompt + "\n" + user_prompt]}
+                {"role": "user", "parts": [user_prompt]}
             ]
         )
         
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+
+# --- CONFIGURATION ---
+CORPUS_DB = "corpus.db"
+DATA_FILE = "MASTER_DATA.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    position INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    changed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    consumer TEXT PRIMARY KEY,
+    last_seq INTEGER NOT NULL
+);
+"""
+
+
+class VersionConflictError(Exception):
+    """Raised when an update was based on a stale version of an item."""
+
+
+def _item_hash(item):
+    payload = json.dumps([item.get("content", ""), item.get("metadata", {})], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CorpusStore:
+    """
+    SQLite-backed corpus of knowledge items (same shape as MASTER_DATA.json entries).
+    Every upsert/delete is one transaction, bumps the item's version and appends
+    to a change feed, so ingestion only has to process what changed.
+    """
+    def __init__(self, path=CORPUS_DB):
+        self.path = path
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, fn):
+        """Runs fn(cursor) in a single write transaction (locks out concurrent writers)."""
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(cur)
+            cur.execute("COMMIT")
+            return result
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+    def upsert(self, items, expected_versions=None):
+        """
+        Inserts or updates items by ID. Unchanged items are skipped (no new version).
+        expected_versions: optional { item_id: version } for optimistic concurrency;
+        raises VersionConflictError if the stored version differs.
+        Returns: { item_id: version } for the items that actually changed.
+        """
+        expected_versions = expected_versions or {}
+
+        def apply(cur):
+            changed = {}
+            now = time.time()
+            next_position = cur.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM items").fetchone()[0]
+            for item in items:
+                item_id = item["id"]
+                row = cur.execute("SELECT version, content_hash, deleted FROM items WHERE id = ?", (item_id,)).fetchone()
+                current_version = row["version"] if row else 0
+                if item_id in expected_versions and expected_versions[item_id] != current_version:
+                    raise VersionConflictError(f"{item_id}: expected version {expected_versions[item_id]}, found {current_version}")
+
+                content_hash = _item_hash(item)
+                if row and not row["deleted"] and row["content_hash"] == content_hash:
+                    continue
+
+                version = current_version + 1
+                content = item.get("content", "")
+                metadata = json.dumps(item.get("metadata", {}))
+                if row:
+                    cur.execute(
+                        "UPDATE items SET content = ?, metadata = ?, content_hash = ?, version = ?, deleted = 0, updated_at = ? WHERE id = ?",
+                        (content, metadata, content_hash, version, now, item_id)
+                    )
+                else:
+                    cur.execute(
+                        "INSERT INTO items (id, content, metadata, content_hash, version, position, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (item_id, content, metadata, content_hash, version, next_position, now)
+                    )
+                    next_position += 1
+                cur.execute("INSERT INTO changes (item_id, op, version, changed_at) VALUES (?, 'upsert', ?, ?)", (item_id, version, now))
+                changed[item_id] = version
+            return changed
+
+        return self._write(apply)
+
+    def delete(self, item_ids):
+        """Soft-deletes items by ID (kept as tombstones so the change feed can report them)."""
+        def apply(cur):
+            deleted = {}
+            now = time.time()
+            for item_id in item_ids:
+                row = cur.execute("SELECT version FROM items WHERE id = ? AND deleted = 0", (item_id,)).fetchone()
+                if not row:
+                    continue
+                version = row["version"] + 1
+                cur.execute("UPDATE items SET deleted = 1, version = ?, updated_at = ? WHERE id = ?", (version, now, item_id))
+                cur.execute("INSERT INTO changes (item_id, op, version, changed_at) VALUES (?, 'delete', ?, ?)", (item_id, version, now))
+                deleted[item_id] = version
+            return deleted
+
+        return self._write(apply)
+
+    def _row_to_item(self, row):
+        return {"id": row["id"], "content": row["content"], "metadata": json.loads(row["metadata"])}
+
+    def get(self, item_id):
+        """Returns: (item, version) or (None, 0) if missing/deleted."""
+        row = self.conn.execute("SELECT * FROM items WHERE id = ? AND deleted = 0", (item_id,)).fetchone()
+        if not row:
+            return None, 0
+        return self._row_to_item(row), row["version"]
+
+    def all_items(self):
+        """Returns all live items in their original order."""
+        rows = self.conn.execute("SELECT * FROM items WHERE deleted = 0 ORDER BY position").fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    # --- CHANGE FEED ---
+    def changes_since(self, seq):
+        """
+        Returns the latest change per item after 'seq', oldest first:
+        [{ "seq", "id", "op", "version", "item" }] ('item' is None for deletes).
+        """
+        rows = self.conn.execute(
+            """
+            SELECT c.seq, c.item_id, c.op, c.version FROM changes c
+            JOIN (SELECT item_id, MAX(seq) AS seq FROM changes WHERE seq > ? GROUP BY item_id) latest
+              ON c.seq = latest.seq
+            ORDER BY c.seq
+            """,
+            (seq,)
+        ).fetchall()
+
+        feed = []
+        for row in rows:
+            item = None
+            if row["op"] == "upsert":
+                item, _ = self.get(row["item_id"])
+            feed.append({"seq": row["seq"], "id": row["item_id"], "op": row["op"], "version": row["version"], "item": item})
+        return feed
+
+    def latest_seq(self):
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def get_cursor(self, consumer):
+        row = self.conn.execute("SELECT last_seq FROM cursors WHERE consumer = ?", (consumer,)).fetchone()
+        return row["last_seq"] if row else 0
+
+    def set_cursor(self, consumer, seq):
+        self._write(lambda cur: cur.execute(
+            "INSERT INTO cursors (consumer, last_seq) VALUES (?, ?) ON CONFLICT(consumer) DO UPDATE SET last_seq = excluded.last_seq",
+            (consumer, seq)
+        ))
+
+    # --- JSON COMPATIBILITY ---
+    def import_json(self, path=DATA_FILE):
+        """Bootstraps the store from a MASTER_DATA-style JSON file. Items without an ID are skipped."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        items = [item for item in data if item.get("id")]
+        changed = self.upsert(items)
+        print(f"Imported {len(items)} items from {path} ({len(changed)} new/changed, {len(data) - len(items)} skipped without ID).")
+        return changed
+
+    def export_json(self, path=DATA_FILE):
+        """Writes all live items as MASTER_DATA-style JSON. Atomic: readers never see a half-written file."""
+        items = self.all_items()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, indent=4)
+        os.replace(tmp_path, path)
+        print(f"Exported {len(items)} items to {path}.")
+
+
+if __name__ == "__main__":
+    # Usage: python corpus_store.py import|export [file]
+    #        python corpus_store.py changes [since_seq]
+    command = sys.argv[1] if len(sys.argv) > 1 else "changes"
+    store = CorpusStore()
+    if command == "import":
+        store.import_json(sys.argv[2] if len(sys.argv) > 2 else DATA_FILE)
+    elif command == "export":
+        store.export_json(sys.argv[2] if len(sys.argv) > 2 else DATA_FILE)
+    elif command == "changes":
+        since = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+        for change in store.changes_since(since):
+            print(f"{change['seq']:>6}  {change['op']:<6}  v{change['version']:<3}  {change['id']}")
+    else:
+        print(f"Unknown command: {command}")
+    store.close()
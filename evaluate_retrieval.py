@@ -0,0 +1,204 @@
+import io
+import json
+import time
+import argparse
+import itertools
+import contextlib
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from ingest import (
+    load_data, generate_embeddings, group_by_namespace,
+    MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP, STRUCTURAL_CUTOFF
+)
+
+# --- CONFIGURATION ---
+GOLDEN_FILE = "golden_queries.json"
+
+# Offline grid. Each chunking config is embedded once and then evaluated
+# against every index config and score threshold.
+CHUNKING_GRID = {
+    "chunk_size": [300, CHUNK_SIZE, 800],
+    "chunk_overlap": [CHUNK_OVERLAP, 100],
+    "structural_cutoff": [STRUCTURAL_CUTOFF],
+    "dedup": [True, False],
+}
+# flat:        unfiltered global scan
+# filtered:    global scan with a category metadata filter (the search that ran before partitions)
+# partitioned: only the query's category partition (brain.search_db today)
+INDEX_GRID = ["flat", "filtered", "partitioned"]
+SCORE_THRESHOLDS = [0.0, 0.3]
+TOP_K_VALUES = [1, 3, 5]
+
+
+class LocalIndex:
+    """
+    In-memory cosine index over ingested vectors, used as a local stand-in for Pinecone.
+    'flat' scans every vector; 'filtered' scans every vector and then applies the
+    category filter; 'partitioned' scans only the query's category.
+    """
+    def __init__(self, vectors, mode):
+        self.mode = mode
+        groups = group_by_namespace(vectors) if mode == "partitioned" else {None: vectors}
+        self.partitions = {}
+        for namespace, ns_vectors in groups.items():
+            embeddings = np.array([v["values"] for v in ns_vectors], dtype=np.float32)
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+            # Only the vector's own source counts: brain returns its context_text, never the
+            # text of sources merged into it at dedup time
+            sources = [v["metadata"]["source_id"] for v in ns_vectors]
+            categories = np.array([v["metadata"].get("category", "") for v in ns_vectors])
+            self.partitions[namespace] = (embeddings, sources, categories)
+        self.size_bytes = sum(e.nbytes for e, _, _ in self.partitions.values()) + len(json.dumps([v["metadata"] for v in vectors]))
+
+    def search(self, query_vector, category, top_k, threshold):
+        """Returns: list of source IDs, one per matched vector, best first."""
+        if self.mode == "partitioned" and category in self.partitions:
+            namespaces = [category]
+        else:
+            namespaces = list(self.partitions)
+
+        query_vector = query_vector / np.linalg.norm(query_vector)
+        scored = []
+        for namespace in namespaces:
+            embeddings, sources, categories = self.partitions[namespace]
+            scores = embeddings @ query_vector
+            if self.mode == "filtered" and category:
+                # Metadata filter evaluated over the whole index
+                scores = np.where(categories == category, scores, -np.inf)
+            for idx in np.argsort(-scores)[:top_k]:
+                if scores[idx] > threshold:
+                    scored.append((float(scores[idx]), sources[idx]))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [source for _, source in scored[:top_k]]
+
+
+def score_results(results, expected):
+    """Returns: ({k: recall@k}, reciprocal rank) for one query."""
+    expected = set(expected)
+    recall = {}
+    for k in TOP_K_VALUES:
+        found = set(results[:k])
+        recall[k] = len(found & expected) / len(expected)
+    reciprocal_rank = 0.0
+    for rank, source in enumerate(results, start=1):
+        if source in expected:
+            reciprocal_rank = 1.0 / rank
+            break
+    return recall, reciprocal_rank
+
+
+def evaluate_config(index, embedder, golden, threshold):
+    """
+    Runs every golden query through the index. Returns aggregate quality and latency metrics.
+    search_ms covers only index.search (what differs between index configs);
+    query_ms adds the query embedding on top.
+    """
+    latencies = []
+    search_latencies = []
+    recalls = {k: [] for k in TOP_K_VALUES}
+    reciprocal_ranks = []
+
+    for case in golden:
+        start = time.perf_counter()
+        query_vector = embedder.encode(case["query"])
+        search_start = time.perf_counter()
+        results = index.search(query_vector, case.get("category"), max(TOP_K_VALUES), threshold)
+        end = time.perf_counter()
+        latencies.append((end - start) * 1000)
+        search_latencies.append((end - search_start) * 1000)
+
+        recall, reciprocal_rank = score_results(results, case["expected_source_ids"])
+        for k in TOP_K_VALUES:
+            recalls[k].append(recall[k])
+        reciprocal_ranks.append(reciprocal_rank)
+
+    metrics = {f"recall@{k}": float(np.mean(recalls[k])) for k in TOP_K_VALUES}
+    metrics["mrr"] = float(np.mean(reciprocal_ranks))
+    metrics["query_ms_mean"] = float(np.mean(latencies))
+    metrics["query_ms_p95"] = float(np.percentile(latencies, 95))
+    metrics["search_ms_mean"] = float(np.mean(search_latencies))
+    metrics["search_ms_p95"] = float(np.percentile(search_latencies, 95))
+    return metrics
+
+
+def run_evaluation(chunking_grid, verbose=False):
+    data = load_data()
+    with open(GOLDEN_FILE, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+    print(f"Loaded {len(golden)} golden queries.")
+
+    print(f"Loading model: {MODEL_NAME}...")
+    embedder = SentenceTransformer(MODEL_NAME)
+
+    keys = list(chunking_grid)
+    rows = []
+    for values in itertools.product(*(chunking_grid[key] for key in keys)):
+        chunking = dict(zip(keys, values))
+        if chunking["chunk_overlap"] >= chunking["chunk_size"]:
+            continue
+        print(f"\nBuilding vectors for {chunking}...")
+
+        # Ingestion is chatty per item; only show it when asked
+        start = time.perf_counter()
+        quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            vectors = generate_embeddings(data, embedder, **chunking)
+        build_s = time.perf_counter() - start
+
+        for mode in INDEX_GRID:
+            start = time.perf_counter()
+            index = LocalIndex(vectors, mode)
+            index_build_s = time.perf_counter() - start
+
+            for threshold in SCORE_THRESHOLDS:
+                row = dict(chunking)
+                row.update({
+                    "index": mode,
+                    "threshold": threshold,
+                    "vectors": len(vectors),
+                    "index_mb": index.size_bytes / 1e6,
+                    "build_s": build_s + index_build_s,
+                })
+                row.update(evaluate_config(index, embedder, golden, threshold))
+                rows.append(row)
+                print(f"   {mode:<11} thr={threshold:<4} recall@5={row['recall@5']:.3f} mrr={row['mrr']:.3f} search_p95={row['search_ms_p95']:.3f}ms")
+
+    return rows
+
+
+def print_report(rows):
+    columns = ["chunk_size", "chunk_overlap", "structural_cutoff", "dedup", "index", "threshold", "vectors",
+               "index_mb", "build_s", "search_ms_mean", "search_ms_p95", "query_ms_mean", "query_ms_p95"] + [f"recall@{k}" for k in TOP_K_VALUES] + ["mrr"]
+    print("\n" + " | ".join(columns))
+    for row in sorted(rows, key=lambda r: (-r["mrr"], r["search_ms_mean"])):
+        cells = [f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in columns]
+        print(" | ".join(cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval quality vs. latency evaluation.")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", help="Override chunk_size grid")
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", help="Override chunk_overlap grid")
+    parser.add_argument("--structural-cutoffs", type=int, nargs="+", help="Override structural_cutoff grid")
+    parser.add_argument("--no-dedup-grid", action="store_true", help="Only evaluate with dedup enabled")
+    parser.add_argument("--output", help="Write all result rows to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show ingestion logs")
+    args = parser.parse_args()
+
+    grid = dict(CHUNKING_GRID)
+    if args.chunk_sizes:
+        grid["chunk_size"] = args.chunk_sizes
+    if args.chunk_overlaps:
+        grid["chunk_overlap"] = args.chunk_overlaps
+    if args.structural_cutoffs:
+        grid["structural_cutoff"] = args.structural_cutoffs
+    if args.no_dedup_grid:
+        grid["dedup"] = [True]
+
+    rows = run_evaluation(grid, verbose=args.verbose)
+    print_report(rows)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nSaved {len(rows)} result rows to {args.output}")
@@ -1,25 +1,58 @@
 import json
 import os
 import time
+import random
+import hashlib
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 from sentence_transformers import SentenceTransformer
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from corpus_store import CorpusStore, CORPUS_DB
 import re
+import sys
 
 # --- CONFIGURATION ---
 load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "college-rag")
 DATA_FILE = "MASTER_DATA.json"
+INGEST_CONSUMER = "ingest"  # Change-feed cursor name for incremental ingestion
 MODEL_NAME = "all-MiniLM-L6-v2"
 
+# Chunking (see evaluate_retrieval.py for measuring the effect of changing these)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+STRUCTURAL_CUTOFF = 1000    # Structural sections shorter than this are kept whole
+
+# Near-duplicate collapse (MinHash + LSH) before embedding
+DEDUP_THRESHOLD = 0.85      # Jaccard similarity above which two chunks are "the same"
+MINHASH_PERMUTATIONS = 64   # Signature length
+LSH_BANDS = 16              # 16 bands x 4 rows -> candidates from ~0.5 similarity upwards
+SHINGLE_WORDS = 3           # Word n-gram size for shingling
+DEDUP_MIN_CHARS = 100       # Shorter chunks (header-only fragments) are never merged
+
+# Per-category partitions: each category is written to its own Pinecone namespace.
+# Every partition is also saved locally: small ones are searched exhaustively in memory,
+# the rest serve as the failover snapshot when Pinecone is slow or down.
+PARTITION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "partitions")
+PARTITION_MANIFEST = os.path.join(PARTITION_DIR, "manifest.json")
+SMALL_PARTITION_SIZE = 200  # Vectors; at or below this a brute-force scan beats a network round-trip
+
 def load_data():
-    """Loads the master JSON data."""
-    print(f"Loading data from {DATA_FILE}...")
+    """Loads the corpus from the corpus store if present, otherwise from the master JSON data."""
     combined_data = []
-    
-    # 1. Load Master Data
+
+    # 1. Corpus Store (preferred)
+    if os.path.exists(CORPUS_DB):
+        print(f"Loading data from {CORPUS_DB}...")
+        store = CorpusStore(CORPUS_DB)
+        combined_data = store.all_items()
+        store.close()
+        print(f"Loaded {len(combined_data)} items from corpus store.")
+        return combined_data
+
+    # 2. Load Master Data
+    print(f"Loading data from {DATA_FILE}...")
     try:
         with open(DATA_FILE, 'r', encoding='utf-8') as f:
             data = json.load(f)
@@ -52,19 +85,142 @@ def init_pinecone():
     print(f"Connected to index: {INDEX_NAME}")
     return pc, index
 
-def generate_embeddings(data, model):
-    """Generates embeddings for the content with auto-chunking."""
-    print(f"Loading model: {MODEL_NAME}...")
-    embedder = SentenceTransformer(MODEL_NAME)
+def get_shingles(text):
+    """Word n-gram shingles of the normalized text."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+# Fixed seed so signatures are stable across runs
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(42)
+_HASH_PARAMS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+def minhash_signature(shingles):
+    """MinHash signature: minimum of each permuted shingle hash."""
+    base_hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in base_hashes) for a, b in _HASH_PARAMS]
+
+def dedupe_chunks(chunks, existing=()):
+    """
+    Collapses near-duplicate chunks before embedding.
+    Chunks are compared within the same category (= partition). Chunks of different
+    items are only merged when their context_text (what the user is shown) is a
+    near-duplicate too, so a merged filter never points at another item's context.
+    Chunks shorter than DEDUP_MIN_CHARS are left alone. The first chunk seen is kept
+    and records the IDs, sources and filters of the chunks merged into it; its 'filter'
+    becomes a list so metadata-filtered searches for any merged filter still match.
+    'existing' are already indexed chunks (same shape): new chunks are checked against
+    them first, and may be merged into them, but they are never returned as kept.
+    Returns: (kept_chunks, stats); stats["updated_existing"] lists the IDs of
+    existing chunks whose metadata changed.
+    """
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    buckets = {}   # (category, band, band_hash) -> [kept chunk positions]
+    kept = []
+    kept_shingles = []
+    context_shingles = {}  # kept position -> shingles of its context_text (computed on demand)
+    updated_existing = set()
+
+    def jaccard(a, b):
+        return len(a & b) / len(a | b)
+
+    def context_of(pos):
+        if pos not in context_shingles:
+            meta = kept[pos]["metadata"]
+            context_shingles[pos] = get_shingles(meta.get("context_text", meta["text"]))
+        return context_shingles[pos]
+
+    def band_keys_for(chunk, shingles):
+        scope = (chunk["metadata"].get("category", ""),)
+        signature = minhash_signature(shingles)
+        return [scope + (b, tuple(signature[b * rows:(b + 1) * rows])) for b in range(LSH_BANDS)]
+
+    # Already indexed chunks take the first positions, so they win ties
+    for chunk in existing:
+        shingles = get_shingles(chunk["text"])
+        if len(chunk["text"]) >= DEDUP_MIN_CHARS:
+            for key in band_keys_for(chunk, shingles):
+                buckets.setdefault(key, []).append(len(kept))
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+    existing_count = len(kept)
+
+    for chunk in chunks:
+        meta = chunk["metadata"]
+        shingles = get_shingles(chunk["text"])
+        if len(chunk["text"]) < DEDUP_MIN_CHARS:
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+            continue
+        band_keys = band_keys_for(chunk, shingles)
+
+        # 1. Candidate lookup via LSH buckets, 2. Verify with exact Jaccard
+        #    (across items the displayed context must match as well)
+        duplicate_of = None
+        candidates = {pos for key in band_keys for pos in buckets.get(key, [])}
+        for pos in sorted(candidates):
+            if jaccard(shingles, kept_shingles[pos]) < DEDUP_THRESHOLD:
+                continue
+            if meta["source_id"] != kept[pos]["metadata"]["source_id"]:
+                own_context = get_shingles(meta.get("context_text", chunk["text"]))
+                if jaccard(own_context, context_of(pos)) < DEDUP_THRESHOLD:
+                    continue
+            duplicate_of = pos
+            break
+
+        if duplicate_of is not None:
+            target = kept[duplicate_of]["metadata"]
+            target.setdefault("merged_ids", []).append(chunk["id"])
+            if meta["source_id"] != target["source_id"] and meta["source_id"] not in target.setdefault("merged_sources", []):
+                target["merged_sources"].append(meta["source_id"])
+            merged_filter = meta.get("filter", "")
+            filters = target["filter"] if isinstance(target.get("filter"), list) else [target.get("filter", "")]
+            if merged_filter not in filters:
+                target["filter"] = filters + [merged_filter]
+            if duplicate_of < existing_count:
+                updated_existing.add(kept[duplicate_of]["id"])
+            continue
+
+        for key in band_keys:
+            buckets.setdefault(key, []).append(len(kept))
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+
+    kept = kept[existing_count:]
+    stats = {
+        "input": len(chunks),
+        "kept": len(kept),
+        "collapsed": len(chunks) - len(kept),
+        "updated_existing": sorted(updated_existing),
+    }
+    return kept, stats
+
+def generate_embeddings(data, model, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                        structural_cutoff=STRUCTURAL_CUTOFF, dedup=True, existing=()):
+    """
+    Generates embeddings for the content with auto-chunking.
+    'model' is a model name or an already loaded SentenceTransformer.
+    'existing' are vectors already in the index: new chunks are deduplicated against
+    them, and any existing vector that absorbed a duplicate is returned again
+    (same ID and values, updated metadata) so the upsert refreshes it.
+    """
+    if isinstance(model, str):
+        print(f"Loading model: {model}...")
+        embedder = SentenceTransformer(model)
+    else:
+        embedder = model
     
     # Standard splitter for normal text
     standard_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", ". ", " ", ""]
     )
     
-    print("Generating embeddings...")
+    print("Chunking items...")
+    chunk_records = []
     items_to_upload = []
     
     for item in data:
@@ -143,12 +299,9 @@ def generate_embeddings(data, model):
                         "chunk_index": i
                     }
                     
-                    # Generate embedding
-                    embedding = embedder.encode(chunk_text).tolist()
-                    
-                    items_to_upload.append({
+                    chunk_records.append({
                         "id": vector_id,
-                        "values": embedding,
+                        "text": chunk_text,
                         "metadata": metadata
                     })
                     
@@ -175,7 +328,7 @@ def generate_embeddings(data, model):
             
             # 2. Recursive Refinement
             for s_chunk in structural_chunks:
-                if len(s_chunk) < 1000:
+                if len(s_chunk) < structural_cutoff:
                     chunks.append(s_chunk)
                 else:
                     sub_chunks = standard_splitter.split_text(s_chunk)
@@ -188,8 +341,6 @@ def generate_embeddings(data, model):
                     if name_context and name_context not in chunk:
                         chunk = f"**{name_context}**\n{chunk}"
 
-                embedding = embedder.encode(chunk).tolist()
-                
                 base_id = item.get("id")
                 if not base_id:
                     print(f"Warning: Item missing ID. Skipping: {item['metadata'].get('sub_category')}")
@@ -197,9 +348,9 @@ def generate_embeddings(data, model):
                     
                 chunk_id = f"{base_id}_chunk_{i}"
                 
-                vector = {
+                chunk_records.append({
                     "id": chunk_id,
-                    "values": embedding,
+                    "text": chunk,
                     "metadata": {
                         "category": item["metadata"]["category"],
                         "subcategory": item["metadata"].get("subcategory", ""), # SAFELY GET
@@ -209,26 +360,237 @@ def generate_embeddings(data, model):
                         "source_id": base_id, 
                         "chunk_index": i
                     }
-                }
-                items_to_upload.append(vector)
+                })
         
+    # 3. Collapse near-duplicate chunks before paying for their embeddings
+    if dedup:
+        print(f"Deduplicating {len(chunk_records)} chunks...")
+        # Only compare against indexed chunks that share a category with the new ones
+        categories = {record["metadata"].get("category", "") for record in chunk_records}
+        existing = [v for v in existing if v["metadata"].get("category", "") in categories]
+        existing_records = [{"id": v["id"], "text": v["metadata"]["text"], "metadata": v["metadata"]} for v in existing]
+        chunk_records, stats = dedupe_chunks(chunk_records, existing_records)
+        reduction = 100 * stats["collapsed"] / stats["input"] if stats["input"] else 0
+        print(f"   -> Collapsed {stats['collapsed']} near-duplicates ({stats['input']} -> {stats['kept']} chunks, -{reduction:.1f}%).")
+        # Metadata was updated in place; re-send those vectors as they are
+        updated_ids = set(stats["updated_existing"])
+        items_to_upload.extend(v for v in existing if v["id"] in updated_ids)
+        if updated_ids:
+            print(f"   -> {len(updated_ids)} indexed vectors absorbed new duplicates.")
+
+    # 4. Embed the remaining chunks in batches
+    embeddings = embedder.encode([record["text"] for record in chunk_records], batch_size=64, show_progress_bar=True)
+    for record, embedding in zip(chunk_records, embeddings):
+        items_to_upload.append({
+            "id": record["id"],
+            "values": embedding.tolist(),
+            "metadata": record["metadata"]
+        })
+
     print(f"Generated {len(items_to_upload)} vectors from {len(data)} items.")
     return items_to_upload
 
+def get_namespace(category):
+    """Maps a category to its partition (Pinecone namespace) name."""
+    return category or "General"
+
+def group_by_namespace(vectors):
+    """Groups vectors into per-category partitions."""
+    partitions = {}
+    for vector in vectors:
+        namespace = get_namespace(vector["metadata"].get("category"))
+        partitions.setdefault(namespace, []).append(vector)
+    return partitions
+
 def upsert_data(index, vectors):
-    """Uploads vectors to Pinecone in batches."""
+    """Uploads vectors to Pinecone in batches, one namespace per category."""
     BATCH_SIZE = 100
-    total_vectors = len(vectors)
-    print(f"Uploading {total_vectors} vectors to Pinecone...")
+    partitions = group_by_namespace(vectors)
+    print(f"Uploading {len(vectors)} vectors to Pinecone across {len(partitions)} namespaces...")
     
-    for i in range(0, total_vectors, BATCH_SIZE):
-        batch = vectors[i:i + BATCH_SIZE]
-        index.upsert(vectors=batch)
-        print(f"   Uploaded batch {i // BATCH_SIZE + 1}/{(total_vectors + BATCH_SIZE - 1) // BATCH_SIZE}")
+    for namespace, ns_vectors in partitions.items():
+        total_vectors = len(ns_vectors)
+        for i in range(0, total_vectors, BATCH_SIZE):
+            batch = ns_vectors[i:i + BATCH_SIZE]
+            index.upsert(vectors=batch, namespace=namespace)
+            print(f"   [{namespace}] Uploaded batch {i // BATCH_SIZE + 1}/{(total_vectors + BATCH_SIZE - 1) // BATCH_SIZE}")
         
     print("Ingestion complete!")
 
+def save_partitions(vectors):
+    """
+    Writes the partition manifest (namespace -> size and search mode) and a
+    local snapshot of every partition (exhaustive search + failover).
+    """
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    manifest = {}
+
+    for namespace, ns_vectors in group_by_namespace(vectors).items():
+        mode = "exhaustive" if len(ns_vectors) <= SMALL_PARTITION_SIZE else "index"
+        manifest[namespace] = {"count": len(ns_vectors), "mode": mode}
+        with open(os.path.join(PARTITION_DIR, f"{namespace}.json"), "w", encoding="utf-8") as f:
+            json.dump(ns_vectors, f)
+
+    with open(PARTITION_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Saved partition manifest to {PARTITION_MANIFEST}:")
+    for namespace, info in manifest.items():
+        print(f"   {namespace}: {info['count']} vectors ({info['mode']})")
+
+def load_partition_snapshots():
+    """Returns: { namespace: [vectors] } from the local snapshots listed in the manifest."""
+    if not os.path.exists(PARTITION_MANIFEST):
+        return None
+    with open(PARTITION_MANIFEST, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    snapshots = {}
+    for namespace in manifest:
+        partition_path = os.path.join(PARTITION_DIR, f"{namespace}.json")
+        with open(partition_path, 'r', encoding='utf-8') as f:
+            snapshots[namespace] = json.load(f)
+    return snapshots
+
+def find_stale_vectors(snapshots, changed_ids):
+    """
+    Finds the indexed vectors that must be replaced for the changed items.
+    A vector is stale if its source changed or a changed item was merged into it
+    at dedup time. Sources merged into a stale vector lose their only copy, so
+    they are pulled in too (repeated until nothing new is added).
+    Returns: ({ namespace: set(vector_ids) }, set(item_ids_to_reembed))
+    """
+    affected = set(changed_ids)
+    stale = {}
+    while True:
+        pulled_in = set()
+        for namespace, vectors in snapshots.items():
+            for v in vectors:
+                meta = v["metadata"]
+                merged = set(meta.get("merged_sources", []))
+                if meta["source_id"] in affected or merged & affected:
+                    stale.setdefault(namespace, set()).add(v["id"])
+                    pulled_in |= ({meta["source_id"]} | merged) - affected
+        if not pulled_in:
+            return stale, affected
+        affected |= pulled_in
+
+def delete_vectors(index, stale_ids):
+    """
+    Deletes vectors by exact ID. IDs come from the local snapshots, never from
+    a prefix: an item ID can be the prefix of another item's ID.
+    Returns: { namespace: deleted_count }
+    """
+    BATCH_SIZE = 1000
+    deleted = {}
+    for namespace, ids in stale_ids.items():
+        ids = sorted(ids)
+        for i in range(0, len(ids), BATCH_SIZE):
+            index.delete(ids=ids[i:i + BATCH_SIZE], namespace=namespace)
+        deleted[namespace] = len(ids)
+    return deleted
+
+def update_partitions(stale_ids, new_vectors):
+    """
+    Applies an incremental change to the local partition snapshots and the
+    manifest: drops the stale vectors and adds (or replaces) the new ones.
+    Only namespaces that gained or lost vectors are rewritten.
+    """
+    manifest = {}
+    if os.path.exists(PARTITION_MANIFEST):
+        with open(PARTITION_MANIFEST, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+
+    new_by_namespace = group_by_namespace(new_vectors)
+    touched = {namespace for namespace, ids in stale_ids.items() if ids} | set(new_by_namespace)
+    for namespace in touched:
+        partition_path = os.path.join(PARTITION_DIR, f"{namespace}.json")
+        local_vectors = []
+        if os.path.exists(partition_path):
+            with open(partition_path, 'r', encoding='utf-8') as f:
+                local_vectors = json.load(f)
+        added = new_by_namespace.get(namespace, [])
+        dropped = stale_ids.get(namespace, set()) | {v["id"] for v in added}
+        local_vectors = [v for v in local_vectors if v["id"] not in dropped] + added
+
+        with open(partition_path, "w", encoding="utf-8") as f:
+            json.dump(local_vectors, f)
+        mode = "exhaustive" if len(local_vectors) <= SMALL_PARTITION_SIZE else "index"
+        manifest[namespace] = {"count": len(local_vectors), "mode": mode}
+
+    with open(PARTITION_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Updated {len(touched)} partition snapshots: {', '.join(sorted(touched)) or 'none'}")
+
+def run_incremental_ingestion():
+    """Processes only the items changed in the corpus store since the last run."""
+    if not os.path.exists(CORPUS_DB):
+        print(f"Error: {CORPUS_DB} not found. Run 'python corpus_store.py import' first.")
+        return
+
+    # The snapshots are the record of which vector IDs belong to which item
+    snapshots = load_partition_snapshots()
+    if snapshots is None:
+        print(f"Error: {PARTITION_MANIFEST} not found. Run a full ingestion first.")
+        return
+
+    # 1. Read the change feed
+    store = CorpusStore(CORPUS_DB)
+    cursor = store.get_cursor(INGEST_CONSUMER)
+    changes = store.changes_since(cursor)
+    if not changes:
+        print("No corpus changes since last ingestion.")
+        store.close()
+        return
+
+    changed_ids = {change["id"] for change in changes}
+    upserts = sum(1 for change in changes if change["op"] == "upsert")
+    print(f"Processing {len(changes)} changed items ({upserts} upserts, {len(changes) - upserts} deletes)...")
+
+    # 2. Work out which vectors go stale and which items have to be re-embedded
+    stale_ids, affected_ids = find_stale_vectors(snapshots, changed_ids)
+    reembed = [item for item, _ in (store.get(item_id) for item_id in sorted(affected_ids)) if item]
+    if len(affected_ids) > len(changed_ids):
+        print(f"   -> {len(affected_ids) - len(changed_ids)} more items share deduplicated vectors and are re-embedded too.")
+
+    # 3. Init Pinecone
+    pc, index = init_pinecone()
+    if not index:
+        store.close()
+        return
+
+    # 4. Drop the stale vectors, then embed the new versions against what stays indexed
+    deleted_counts = delete_vectors(index, stale_ids)
+    print(f"Deleted {sum(deleted_counts.values())} stale vectors.")
+
+    remaining = [v for namespace, vectors in snapshots.items() for v in vectors
+                 if v["id"] not in stale_ids.get(namespace, set())]
+    vectors = generate_embeddings(reembed, MODEL_NAME, existing=remaining) if reembed else []
+    if vectors:
+        upsert_data(index, vectors)
+    update_partitions(stale_ids, vectors)
+
+    # 5. Advance the cursor only after everything was applied
+    store.set_cursor(INGEST_CONSUMER, max(change["seq"] for change in changes))
+    store.close()
+    print("Incremental ingestion complete!")
+
+def clear_namespaces(index):
+    """Deletes every vector in every namespace of the index."""
+    namespaces = list(index.describe_index_stats().namespaces)
+    for namespace in namespaces:
+        index.delete(delete_all=True, namespace=namespace)
+    print(f"Cleared {len(namespaces)} namespaces.")
+
 def run_ingestion():
+    # 0. Remember how far the change feed goes before reading (later changes stay pending)
+    ingested_seq = None
+    if os.path.exists(CORPUS_DB):
+        store = CorpusStore(CORPUS_DB)
+        ingested_seq = store.latest_seq()
+        store.close()
+
     # 1. Load Data
     data = load_data()
     if not data: return
@@ -240,11 +602,24 @@ def run_ingestion():
     # 3. Generate Embeddings
     vectors = generate_embeddings(data, MODEL_NAME)
     
-    # 4. Upload
+    # 4. Replace the index contents (upserting alone would keep vectors of deleted items)
     if vectors:
+        clear_namespaces(index)
         upsert_data(index, vectors)
+        save_partitions(vectors)
     else:
         print("No valid vectors to upload.")
+        return
+
+    # 5. Incremental ingestion can continue from here
+    if ingested_seq is not None:
+        store = CorpusStore(CORPUS_DB)
+        store.set_cursor(INGEST_CONSUMER, ingested_seq)
+        store.close()
 
 if __name__ == "__main__":
-    run_ingestion()
+    # Usage: python ingest.py [--incremental]
+    if "--incremental" in sys.argv:
+        run_incremental_ingestion()
+    else:
+        run_ingestion()
@@ -0,0 +1,209 @@
+import abc
+import json
+import time
+import datetime
+import google.generativeai as genai
+
+# --- STATIC PROMPT PARTS ---
+# Everything in this section is built ONCE at import time.
+# Per-turn calls only fill in the dynamic sections (query, history, context).
+
+SYSTEM_PROMPT = """
+You are 'Digital Senior', a helpful senior student at NIT Warangal.
+
+Rules:
+1. **CRITICAL:** Answer directly and confidently. Treat the provided Context as your own absolute internal knowledge.
+2. **NEVER** reference "the context", "the provided text", "the documents", or "the information provided". Phrases like "Based on the context" or "The text doesn't say" are STRICTLY FORBIDDEN.
+3. If the answer is not in your knowledge base (the Context), simply say "I don't have enough information to answer that" or "I'm not sure about that specifically". Do NOT excuse yourself by blaming the missing context.
+4. Be concise, professional, and friendly.
+5. Do NOT start with greetings like "Hey there". Start directly with the answer.
+6. Do NOT end with "Hope this helps".
+7. OUTPUT FORMAT: PLAIN TEXT ONLY. No Markdown (no **, *, #). Use simple numbering (1., 2.) or dashes (-) for lists.
+8. **Restaurant Reviews:** When answering about restaurants:
+    - IGNORE the names of the people writing the reviews (e.g. "syed zafar", "Anil Kumar"). They are irrelevant.
+    - Focus ONLY on the **Restaurant Name** and the **Substance** of the review (good food, bad service, specific dishes).
+    - If the context contains a list of reviews, summarize the general sentiment or specific dishes mentioned for that restaurant.
+    - Expected Format: "- [Restaurant Name]: [Summary of what's good/bad] (Price/Location if available)"
+"""
+
+# Define the hierarchy of knowledge available in the system
+# This helps the LLM understand what specific topics fall under which category
+KNOWLEDGE_HIERARCHY = {
+    "Faculty": ["Specific Professors (e.g., D V S S Siva Sarma)", "Research Areas", "Teaching Style"],
+    "Academics": ["Attendance Policy", "UG Regulations", "Academic Calendar", "Student Feedback"],
+    "Food": ["Canteens", "Messes (e.g. IFC - B)", "Menu"],
+    "Hostels": ["Hostel Blocks (e.g., Azad, Bose)", "General Rules", "Facilities", "Wardens", "Repairs (LAN, Electrician, Plumbing)", "Issues"],
+    "Placements": ["Company Details", "Placement Statistics"],
+    "Campus_Life": ["Fests", "Clubs", "Events"],
+    "Admin": ["Fees & Scholarships", "Documents & Transcripts"],
+    "Facilities": ["Library", "Health Centre", "Sports"],
+    "Guides": ["City Guide", "Freshers Guide"],
+    "Internships": ["Company Specific Experiences (e.g. Amazon, Microsoft)", "Process", "Questions"]
+}
+
+ROUTER_PROMPT = f"""
+You are the Router for a college chatbot. Your job is to classify the user's intent into one of the available categories or identify it as chit-chat.
+Each message gives you the User Query and the Recent History of the conversation.
+
+Available Knowledge Hierarchy (Category -> Subcategories/Topics):
+{json.dumps(KNOWLEDGE_HIERARCHY, indent=2)}
+
+Instructions:
+1. Analyze the User Query to understand what they are looking for.
+2. Match their intent to the most relevant 'Category' from the hierarchy above. Use the subcategories as strong hints.
+   - Example: "When is the exam?" -> Matches 'Academic Calendar' -> Category: "Academics"
+   - Example: "Who is the warden of Azad Hall?" -> Matches 'Wardens'/'Hostel Blocks' -> Category: "Hostels"
+   - Example: "Tell me about Prof Siva Sarma" -> Matches 'Specific Professors' -> Category: "Faculty"
+   - Example: "What is for dinner in IFC B?" -> Matches 'Messes' -> Category: "Food", filters: {{ "filter": "IFC - B" }}
+   - Example: "Lan repair number?" -> Matches 'Repairs' -> Category: "Hostels"
+3. If the user asks about a specific topic not explicitly listed but related to a category (e.g., "Mess menu" relates to "Food"), choose that category.
+4. Extract 'filter' for:
+   - 'Internships' (Target: Company Name)
+   - 'Food' (Target: Mess Name)
+   - 'Academics' (Target: Specific Course Name).
+     - Do NOT extract generic terms like "Credits", "Syllabus", "Exams", "Regulations", "Grades" as filters. Set "filter": null for general queries.
+     - Example: "Syllabus for Digital Electronics" -> Category: "Academics", filters: {{ "filter": "Digital Electronics" }}
+     - Example: "How are credits assigned?" -> Category: "Academics", filters: {{ "filter": null }}
+5. If the user says "Hi", "Thanks", "Bye", or asks a general question NOT about the college (e.g. "What is 2+2?"), output type="chit_chat".
+6. Write 'search_query': a standalone version of the User Query for searching the knowledge base.
+   - If the query is a follow-up that depends on Recent History (e.g. "what about his exam pattern?"), replace pronouns with the entity they refer to.
+     - Example: History "Tell me about Prof Siva Sarma", Query "what about his exam pattern?" -> search_query: "Prof Siva Sarma exam pattern"
+   - Otherwise repeat the User Query unchanged.
+
+Output JSON ONLY:
+{{ "type": "rag_search" | "chit_chat", "category": "CategoryName" | null, "filters": {{ "filter": "FILTER_VALUE" | null }}, "search_query": "STANDALONE_QUERY" }}
+"""
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate (~4 chars per token). Avoids a count_tokens API round-trip."""
+    return (len(text) + 3) // 4
+
+
+def format_history(history, last_n):
+    """Formats the last N chat messages as 'role: content' lines."""
+    return "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-last_n:]])
+
+
+class PromptTemplate:
+    """
+    A prompt split into a static prefix (sent as the model's system instruction,
+    cacheable) and a dynamic per-turn body with named sections.
+    """
+    def __init__(self, name, static_prefix, sections):
+        self.name = name
+        self.static_prefix = static_prefix
+        # List of (section_name, format_string) pairs, rendered in order
+        self.sections = sections
+
+    def render(self, **parts):
+        """Assembles only the dynamic part of the prompt."""
+        return "\n\n".join(fmt.format(**parts) for _, fmt in self.sections)
+
+    def section_tokens(self, count_fn=estimate_tokens, **parts):
+        """
+        Counts tokens per section of the prompt.
+        Returns: { "static_prefix": N, "<section>": N, ..., "dynamic_total": N }
+        """
+        counts = {"static_prefix": count_fn(self.static_prefix)}
+        for section_name, fmt in self.sections:
+            counts[section_name] = count_fn(fmt.format(**parts))
+        counts["dynamic_total"] = sum(n for key, n in counts.items() if key != "static_prefix")
+        return counts
+
+
+ROUTER_TEMPLATE = PromptTemplate(
+    name="router",
+    static_prefix=ROUTER_PROMPT,
+    sections=[
+        ("query", 'User Query: "{query}"'),
+        ("history", "Recent History:\n{history}"),
+    ]
+)
+
+GENERATOR_TEMPLATE = PromptTemplate(
+    name="generator",
+    static_prefix=SYSTEM_PROMPT,
+    sections=[
+        ("context", "Context:\n{context}"),
+        ("history", "Chat History:\n{history}"),
+        ("query", "User: {query}"),
+    ]
+)
+
+
+# --- STATIC PREFIX CACHES ---
+class PrefixCache(abc.ABC):
+    """
+    Interface: hands out a model that already carries a template's static prefix,
+    so each call only sends the dynamic part.
+    """
+    @abc.abstractmethod
+    def get_model(self, template):
+        """Returns a model whose static prefix is template.static_prefix."""
+
+
+class LocalPrefixCache(PrefixCache):
+    """
+    Local stand-in: one GenerativeModel per template with the static prefix
+    set as its system_instruction. Built once and reused for every turn.
+    """
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._models = {}
+
+    def get_model(self, template):
+        if template.name not in self._models:
+            self._models[template.name] = genai.GenerativeModel(
+                model_name=self.model_name,
+                system_instruction=template.static_prefix
+            )
+        return self._models[template.name]
+
+
+class GeminiContextCache(PrefixCache):
+    """
+    Provider-side context caching: uploads the static prefix once as
+    CachedContent and builds the model from it. Recreated after the TTL expires.
+    Prefixes below the provider's minimum cacheable size (or a failed cache
+    creation) use the local stand-in instead.
+    """
+    def __init__(self, model_name, ttl_minutes=60, min_cacheable_tokens=4096):
+        self.model_name = model_name
+        self.ttl = datetime.timedelta(minutes=ttl_minutes)
+        # Gemini rejects explicit caches smaller than this
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self.fallback = LocalPrefixCache(model_name)
+        self._entries = {}  # template name -> (model, expires_at)
+
+    def get_model(self, template):
+        entry = self._entries.get(template.name)
+        if entry and time.time() < entry[1]:
+            return entry[0]
+
+        prefix_tokens = estimate_tokens(template.static_prefix)
+        if prefix_tokens < self.min_cacheable_tokens:
+            # Decided once per template: the entry never expires
+            print(f"Context Cache: '{template.name}' prefix is ~{prefix_tokens} tokens "
+                  f"(< {self.min_cacheable_tokens} minimum). Using local prefix.")
+            model = self.fallback.get_model(template)
+            self._entries[template.name] = (model, float("inf"))
+            return model
+
+        try:
+            cached = genai.caching.CachedContent.create(
+                model=f"models/{self.model_name}",
+                display_name=f"digital-senior-{template.name}",
+                system_instruction=template.static_prefix,
+                ttl=self.ttl
+            )
+            model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+            # Refresh a minute early so we never call into an expired cache
+            expires_at = time.time() + self.ttl.total_seconds() - 60
+        except Exception as e:
+            print(f"Context Cache Error ({template.name}): {e}. Using local prefix.")
+            model = self.fallback.get_model(template)
+            expires_at = float("inf")
+
+        self._entries[template.name] = (model, expires_at)
+        return model
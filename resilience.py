@@ -0,0 +1,164 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies (seconds)."""
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p):
+        """Returns the p-th percentile, or None until enough samples were seen."""
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Opens after 'failure_threshold' consecutive failures. While open, calls are
+    rejected; after 'reset_timeout' seconds a single trial call is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """Returns True if this failure opened the breaker."""
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+                return True
+            return False
+
+
+class GuardedCall:
+    """
+    Wraps calls to a remote dependency with:
+    - a per-call deadline,
+    - an optional hedged second request once the first one is slower than the
+      recent 'hedge_percentile' latency,
+    - a circuit breaker that sends calls straight to the fallback while open.
+    On timeout, error or open breaker the fallback's result is returned instead.
+    The wrapped call must be idempotent (it may run twice).
+    """
+    def __init__(self, name, timeout=2.0, hedge_percentile=95, min_hedge_samples=20,
+                 failure_threshold=5, reset_timeout=30.0, max_workers=16):
+        self.name = name
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker(min_samples=min_hedge_samples)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # Own pool: abandoned (timed-out) calls must not starve the caller's workers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.counters = {
+            "calls": 0, "timeouts": 0, "errors": 0, "hedges": 0, "hedge_wins": 0,
+            "failovers": 0, "short_circuits": 0, "breaker_opens": 0
+        }
+        self.lock = threading.Lock()
+
+    def _count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def stats(self):
+        """Returns a snapshot of the counters plus breaker state and hedge threshold."""
+        with self.lock:
+            stats = dict(self.counters)
+        stats["breaker_state"] = self.breaker.state
+        stats["hedge_after_s"] = self.latency.percentile(self.hedge_percentile)
+        return stats
+
+    def call(self, primary, fallback):
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuits")
+            self._count("failovers")
+            return fallback()
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        first = self.pool.submit(primary)
+        pending = {first}
+
+        # 1. Hedge: if the first request is slower than usual, race a second one
+        hedge_after = self.latency.percentile(self.hedge_percentile)
+        if hedge_after is not None and hedge_after < self.timeout:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done:
+                self._count("hedges")
+                pending.add(self.pool.submit(primary))
+
+        # 2. Take the first successful response before the deadline
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.latency.record(time.monotonic() - start)
+                    self.breaker.record_success()
+                    if future is not first:
+                        self._count("hedge_wins")
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+
+        # 3. Timed out or every attempt failed: fail over
+        for future in pending:
+            future.cancel()
+        if pending:
+            self._count("timeouts")
+            print(f"{self.name} Timeout after {self.timeout}s. Failing over.")
+        else:
+            self._count("errors")
+            print(f"{self.name} Error: {error}. Failing over.")
+        if self.breaker.record_failure():
+            self._count("breaker_opens")
+            print(f"{self.name} circuit breaker OPEN for {self.breaker.reset_timeout}s.")
+        self._count("failovers")
+        return fallback()
@@ -1,7 +1,11 @@
-import json
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus_store import CorpusStore
 
 file_path = "MASTER_DATA.json"
+db_path = "corpus.db"
 
 new_items = [
     {
@@ -24,27 +28,27 @@ new_items = [
     }
 ]
 
-def update_data():
+def update_data(export=False):
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        print(f"Loaded {len(data)} items.")
-        
-        # Remove existing items with same ID if any (to avoid duplicates during retries)
-        existing_ids = {item["id"] for item in new_items}
-        data = [item for item in data if item.get("id") not in existing_ids]
-        
-        # Append new items
-        data.extend(new_items)
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
-            
-        print(f"Successfully updated {file_path}. Total items: {len(data)}")
+        store = CorpusStore(db_path)
+
+        # Bootstrap the store from the JSON file on first use
+        if store.latest_seq() == 0 and os.path.exists(file_path):
+            store.import_json(file_path)
+
+        # Upsert by ID: only these items are written, and re-running is a no-op
+        changed = store.upsert(new_items)
+        print(f"Updated {len(changed)} items in {db_path}: {changed}")
+
+        # Optional: regenerate MASTER_DATA.json for tools that still read the JSON file
+        if export:
+            store.export_json(file_path)
+
+        store.close()
         
     except Exception as e:
-        print(f"Error updating file: {e}")
+        print(f"Error updating corpus: {e}")
 
 if __name__ == "__main__":
-    update_data()
+    # Usage: python scripts/update_master_safely.py [--export]
+    update_data(export="--export" in sys.argv)